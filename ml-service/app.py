@@ -3,14 +3,70 @@ FastAPI Service for ML Inference
 Exposes recommendation endpoints
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Literal, Optional
+from contextlib import asynccontextmanager
 import os
 from recommender import CourseRecommender
+from batching import DynamicBatcher
 
-app = FastAPI(title="Course Recommendation API", version="1.0.0")
+
+def load_recommender():
+    """
+    Load the trained recommender
+    
+    Returns:
+        (recommender, error): The loaded recommender and None, or None and a message
+        explaining why the model artifacts could not be loaded
+    """
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    model_path = os.path.join(script_dir, 'kmeans_model.pkl')
+    data_path = os.path.join(script_dir, 'courses_with_clusters.csv')
+    features_path = os.path.join(script_dir, 'course_features.joblib')
+    normalized_features_path = os.path.join(script_dir, 'course_features_normalized.joblib')
+    
+    if not all(os.path.exists(p) for p in [model_path, data_path, features_path, normalized_features_path]):
+        error = "Model not trained. Please run train.py first."
+        print(error)
+        return None, error
+    
+    try:
+        recommender = CourseRecommender(
+            model_path=model_path,
+            data_path=data_path,
+            features_path=features_path,
+            normalized_features_path=normalized_features_path
+        )
+        
+        # Warm up the inference path (profile building, cluster predict, similarity)
+        # so the first user request doesn't pay for it
+        recommender.recommend(limit=1)
+    except Exception as e:
+        # Keep serving so /health can report broken or incompatible artifacts
+        error = f"Failed to load model: {str(e)}"
+        print(error)
+        return None, error
+    
+    return recommender, None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Load the recommender and start the request batcher before serving traffic"""
+    app.state.recommender, app.state.recommender_error = load_recommender()
+    app.state.batcher = DynamicBatcher(
+        lambda tasks: get_recommender().recommend_batch(tasks),
+        max_batch_size=16,
+        max_delay=0.02
+    )
+    app.state.batcher.start()
+    yield
+    await app.state.batcher.stop()
+
+
+app = FastAPI(title="Course Recommendation API", version="1.0.0", lifespan=lifespan)
 
 # CORS middleware for frontend integration
 app.add_middleware(
@@ -21,35 +77,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize recommender (lazy loading)
-recommender = None
 
 def get_recommender():
-    """Lazy load recommender to handle missing files gracefully"""
-    global recommender
+    """Get the recommender loaded at startup"""
+    recommender = getattr(app.state, 'recommender', None)
     if recommender is None:
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        model_path = os.path.join(script_dir, 'kmeans_model.pkl')
-        preprocessor_path = os.path.join(script_dir, 'preprocessor.pkl')
-        data_path = os.path.join(script_dir, 'courses_with_clusters.csv')
-        
-        if not all(os.path.exists(p) for p in [model_path, preprocessor_path, data_path]):
-            raise HTTPException(
-                status_code=503,
-                detail="Model not trained. Please run train.py first."
-            )
-        
-        recommender = CourseRecommender(
-            model_path=model_path,
-            preprocessor_path=preprocessor_path,
-            data_path=data_path
+        raise HTTPException(
+            status_code=503,
+            detail=getattr(app.state, 'recommender_error', None) or "Model not loaded"
         )
     return recommender
 
 
+# Valid difficulty levels (validated by Pydantic before the handler runs)
+Difficulty = Literal['Beginner', 'Intermediate', 'Advanced', 'Mixed']
+
+
 class RecommendationRequest(BaseModel):
     """Request model for recommendations"""
-    preferred_difficulty: Optional[str] = Field(
+    preferred_difficulty: Optional[Difficulty] = Field(
         None, 
         description="Preferred difficulty: Beginner, Intermediate, Advanced, or Mixed"
     )
@@ -106,44 +152,34 @@ def health():
         return {
             "status": "healthy",
             "model_loaded": True,
-            "n_courses": len(rec.courses_df)
+            "n_courses": len(rec.courses_df),
+            "profile_cache": rec.profile_cache_info()
         }
-    except Exception as e:
+    except HTTPException as e:
         return {
             "status": "unhealthy",
             "model_loaded": False,
-            "error": str(e)
+            "error": e.detail
         }
 
 
 @app.post("/recommend", response_model=List[RecommendationResponse])
-def get_recommendations(request: RecommendationRequest):
+async def get_recommendations(request: RecommendationRequest):
     """
     Get course recommendations based on user preferences
     
-    Validates input and returns personalized recommendations with explanations
+    Validates input and returns personalized recommendations with explanations.
+    Concurrent requests are batched into a single similarity computation.
     """
     try:
-        # Validate difficulty if provided
-        if request.preferred_difficulty:
-            valid_difficulties = ['Beginner', 'Intermediate', 'Advanced', 'Mixed']
-            if request.preferred_difficulty not in valid_difficulties:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Invalid difficulty. Must be one of: {', '.join(valid_difficulties)}"
-                )
-        
-        # Get recommender
-        rec = get_recommender()
-        
         # Generate recommendations
-        recommendations = rec.recommend(
-            preferred_difficulty=request.preferred_difficulty,
-            liked_courses=request.liked_courses or [],
-            preferred_organizations=request.preferred_organizations or [],
-            limit=request.limit,
-            rating_bias=request.rating_bias
-        )
+        recommendations = await app.state.batcher.submit({
+            'preferred_difficulty': request.preferred_difficulty,
+            'liked_courses': request.liked_courses or [],
+            'preferred_organizations': request.preferred_organizations or [],
+            'limit': request.limit,
+            'rating_bias': request.rating_bias
+        })
         
         if not recommendations:
             raise HTTPException(
@@ -168,10 +204,10 @@ def get_cluster_info(cluster_id: int):
     try:
         rec = get_recommender()
         
-        if cluster_id < 0 or cluster_id >= rec.kmeans_model.n_clusters:
+        if cluster_id < 0 or cluster_id >= rec.n_clusters:
             raise HTTPException(
                 status_code=400,
-                detail=f"Invalid cluster_id. Must be between 0 and {rec.kmeans_model.n_clusters - 1}"
+                detail=f"Invalid cluster_id. Must be between 0 and {rec.n_clusters - 1}"
             )
         
         return rec.get_cluster_info(cluster_id)
@@ -186,18 +222,26 @@ def get_cluster_info(cluster_id: int):
 
 
 @app.get("/courses")
-def list_courses(limit: int = 100, offset: int = 0):
-    """List all available courses (paginated)"""
+def list_courses(response: Response, limit: int = 100, offset: int = 0,
+                 if_none_match: Optional[str] = Header(None)):
+    """List all available courses (paginated, supports If-None-Match)"""
     try:
         rec = get_recommender()
         
-        courses = rec.courses_df.iloc[offset:offset+limit]
+        # Course data is static per process, so a matching ETag means the client copy is current.
+        # If-None-Match uses weak comparison, so ignore W/ prefixes (e.g. added by gzip proxies)
+        if if_none_match:
+            etags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+            if '*' in etags or rec.courses_etag in etags:
+                return Response(status_code=304, headers={"ETag": rec.courses_etag})
+        
+        response.headers["ETag"] = rec.courses_etag
         
         return {
-            "total": len(rec.courses_df),
+            "total": len(rec.course_records),
             "limit": limit,
             "offset": offset,
-            "courses": courses.to_dict('records')
+            "courses": rec.course_records[offset:offset+limit]
         }
     
     except Exception as e:
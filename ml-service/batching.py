@@ -0,0 +1,82 @@
+"""
+Dynamic Request Batching
+Coalesces concurrent recommendation requests into a single batched inference call
+"""
+
+import asyncio
+
+
+class DynamicBatcher:
+    """Collects concurrent requests and processes them together in batches"""
+
+    def __init__(self, process_batch, max_batch_size=16, max_delay=0.02):
+        """
+        Args:
+            process_batch: Callable taking a list of tasks and returning a list of results
+            max_batch_size: Maximum number of tasks processed in one batch
+            max_delay: Maximum time (seconds) to wait for more tasks after the first arrives
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._queue = None
+        self._worker = None
+
+    def start(self):
+        """Start the background batching loop"""
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background batching loop"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def submit(self, task):
+        """Queue a task and wait for its result"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((task, future))
+        return await future
+
+    async def _collect_batch(self):
+        """Wait for a first task, then gather more until the batch is full or the delay expires"""
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_delay
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        """Process batches until cancelled"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = await self._collect_batch()
+            tasks = [task for task, _ in batch]
+
+            try:
+                # Run the (CPU-bound) batch outside the event loop
+                results = await loop.run_in_executor(None, self.process_batch, tasks)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
@@ -5,98 +5,114 @@ Handles encoding, normalization, and feature matrix creation
 
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.feature_extraction.text import TfidfVectorizer
+from scipy import sparse
+from sklearn.preprocessing import StandardScaler, LabelEncoder, OneHotEncoder
+from sklearn.feature_extraction.text import HashingVectorizer
 import re
 import pickle
 import os
 
 
+DIFFICULTY_MAP = {
+    'Beginner': 1,
+    'Intermediate': 2,
+    'Advanced': 3,
+    'Mixed': 2.5
+}
+
+ENROLLMENT_MULTIPLIERS = {
+    'M': 1_000_000,
+    'K': 1_000
+}
+
+# Raw course columns and their types for pd.read_csv (skips dtype inference;
+# categoricals store each repeated string once)
+COURSE_DTYPES = {
+    'course_title': 'string',
+    'course_organization': 'category',
+    'course_Certificate_type': 'category',
+    'course_rating': 'float64',
+    'course_difficulty': 'category',
+    'course_students_enrolled': 'string'
+}
+
+COURSE_USECOLS = list(COURSE_DTYPES)
+
+
 class CoursePreprocessor:
     """Handles all preprocessing steps for course data"""
     
     def __init__(self):
         self.scaler = StandardScaler()
         self.label_encoders = {}
-        self.tfidf_vectorizer = TfidfVectorizer(max_features=50, stop_words='english')
+        self.org_encoder = OneHotEncoder(handle_unknown='ignore', sparse_output=True)
+        self.cert_encoder = OneHotEncoder(handle_unknown='ignore', sparse_output=True)
+        # Stateless title hashing: no vocabulary to fit or persist
+        self.title_hasher = HashingVectorizer(
+            n_features=64, alternate_sign=False, stop_words='english', norm='l2'
+        )
         self.feature_names = []
         self.is_fitted = False
         
-    def _normalize_enrollment(self, enrollment_str):
-        """Convert enrollment strings like '1.2M' to numeric values"""
-        if pd.isna(enrollment_str):
-            return 0
-        
-        enrollment_str = str(enrollment_str).strip().upper()
-        
-        # Extract number and multiplier
-        match = re.search(r'([\d.]+)\s*([KM]?)', enrollment_str)
-        if not match:
-            return 0
-        
-        number = float(match.group(1))
-        multiplier = match.group(2)
+    def _normalize_enrollment(self, enrollment):
+        """Convert enrollment strings like '1.2M' to numeric values (vectorized)"""
+        # Extract number and multiplier in a single case-insensitive regex pass,
+        # avoiding extra strip/upper copies of the whole column
+        extracted = enrollment.astype(str).str.extract(
+            r'([\d.]+)\s*([KM]?)', flags=re.IGNORECASE
+        )
+        numbers = pd.to_numeric(extracted[0], errors='coerce').fillna(0).to_numpy()
+        multipliers = extracted[1].str.upper().map(ENROLLMENT_MULTIPLIERS).fillna(1.0).to_numpy()
         
-        if multiplier == 'M':
-            return number * 1_000_000
-        elif multiplier == 'K':
-            return number * 1_000
-        else:
-            return number
+        return numbers * multipliers
     
     def _encode_difficulty(self, difficulty):
-        """Convert difficulty to ordinal scale"""
-        difficulty_map = {
-            'Beginner': 1,
-            'Intermediate': 2,
-            'Advanced': 3,
-            'Mixed': 2.5
-        }
-        return difficulty_map.get(str(difficulty).strip(), 2)
+        """Convert difficulty to ordinal scale (vectorized)"""
+        return difficulty.astype(str).str.strip().map(DIFFICULTY_MAP).fillna(2).to_numpy()
     
     def fit_transform(self, df):
         """Fit preprocessor and transform data"""
         # Normalize enrollment
-        df['enrollment_numeric'] = df['course_students_enrolled'].apply(
-            self._normalize_enrollment
+        df['enrollment_numeric'] = self._normalize_enrollment(
+            df['course_students_enrolled']
         )
         
         # Encode difficulty
-        df['difficulty_encoded'] = df['course_difficulty'].apply(
-            self._encode_difficulty
+        df['difficulty_encoded'] = self._encode_difficulty(
+            df['course_difficulty']
         )
         
         # One-hot encode organizations
-        org_dummies = pd.get_dummies(df['course_organization'], prefix='org')
+        org_features = self.org_encoder.fit_transform(df[['course_organization']])
         
         # One-hot encode certificate types
-        cert_dummies = pd.get_dummies(df['course_Certificate_type'], prefix='cert')
+        cert_features = self.cert_encoder.fit_transform(df[['course_Certificate_type']])
         
-        # TF-IDF on course titles for semantic similarity
-        title_features = self.tfidf_vectorizer.fit_transform(
+        # Hashed bag-of-words on course titles for semantic similarity
+        title_features = self.title_hasher.transform(
             df['course_title'].fillna('')
-        ).toarray()
+        )
         title_feature_names = [
-            f'title_tfidf_{i}' for i in range(title_features.shape[1])
+            f'title_hash_{i}' for i in range(title_features.shape[1])
         ]
         
         # Normalize numeric features
         numeric_features = df[['course_rating', 'enrollment_numeric', 'difficulty_encoded']].values
         numeric_features_scaled = self.scaler.fit_transform(numeric_features)
         
-        # Combine all features
-        feature_matrix = np.hstack([
-            numeric_features_scaled,
-            org_dummies.values,
-            cert_dummies.values,
+        # Combine all features into a float32 sparse matrix (one-hot and title hash blocks are mostly zeros)
+        feature_matrix = sparse.hstack([
+            sparse.csr_matrix(numeric_features_scaled),
+            org_features,
+            cert_features,
             title_features
-        ])
+        ], format='csr', dtype=np.float32)
         
         # Store feature names for interpretability
         self.feature_names = (
             ['rating_scaled', 'enrollment_scaled', 'difficulty_scaled'] +
-            list(org_dummies.columns) +
-            list(cert_dummies.columns) +
+            [f'org_{c}' for c in self.org_encoder.categories_[0]] +
+            [f'cert_{c}' for c in self.cert_encoder.categories_[0]] +
             title_feature_names
         )
         
@@ -110,48 +126,37 @@ class CoursePreprocessor:
             raise ValueError("Preprocessor must be fitted before transform")
         
         # Normalize enrollment
-        df['enrollment_numeric'] = df['course_students_enrolled'].apply(
-            self._normalize_enrollment
+        df['enrollment_numeric'] = self._normalize_enrollment(
+            df['course_students_enrolled']
         )
         
         # Encode difficulty
-        df['difficulty_encoded'] = df['course_difficulty'].apply(
-            self._encode_difficulty
+        df['difficulty_encoded'] = self._encode_difficulty(
+            df['course_difficulty']
         )
         
-        # One-hot encode organizations (align with training data)
-        org_dummies = pd.get_dummies(df['course_organization'], prefix='org')
-        # Reindex to match training columns
-        org_cols = [col for col in self.feature_names if col.startswith('org_')]
-        for col in org_cols:
-            if col not in org_dummies.columns:
-                org_dummies[col] = 0
-        org_dummies = org_dummies.reindex(columns=org_cols, fill_value=0)
+        # One-hot encode organizations (unseen categories encode as all zeros)
+        org_features = self.org_encoder.transform(df[['course_organization']])
         
         # One-hot encode certificate types
-        cert_dummies = pd.get_dummies(df['course_Certificate_type'], prefix='cert')
-        cert_cols = [col for col in self.feature_names if col.startswith('cert_')]
-        for col in cert_cols:
-            if col not in cert_dummies.columns:
-                cert_dummies[col] = 0
-        cert_dummies = cert_dummies.reindex(columns=cert_cols, fill_value=0)
-        
-        # TF-IDF on course titles
-        title_features = self.tfidf_vectorizer.transform(
+        cert_features = self.cert_encoder.transform(df[['course_Certificate_type']])
+        
+        # Hashed bag-of-words on course titles
+        title_features = self.title_hasher.transform(
             df['course_title'].fillna('')
-        ).toarray()
+        )
         
         # Normalize numeric features
         numeric_features = df[['course_rating', 'enrollment_numeric', 'difficulty_encoded']].values
         numeric_features_scaled = self.scaler.transform(numeric_features)
         
-        # Combine all features
-        feature_matrix = np.hstack([
-            numeric_features_scaled,
-            org_dummies.values,
-            cert_dummies.values,
+        # Combine all features into a float32 sparse matrix (one-hot and title hash blocks are mostly zeros)
+        feature_matrix = sparse.hstack([
+            sparse.csr_matrix(numeric_features_scaled),
+            org_features,
+            cert_features,
             title_features
-        ])
+        ], format='csr', dtype=np.float32)
         
         return feature_matrix, df
     
@@ -160,7 +165,9 @@ class CoursePreprocessor:
         with open(filepath, 'wb') as f:
             pickle.dump({
                 'scaler': self.scaler,
-                'tfidf_vectorizer': self.tfidf_vectorizer,
+                'org_encoder': self.org_encoder,
+                'cert_encoder': self.cert_encoder,
+                'title_hasher': self.title_hasher,
                 'feature_names': self.feature_names,
                 'is_fitted': self.is_fitted
             }, f)
@@ -173,7 +180,9 @@ class CoursePreprocessor:
         
         preprocessor = cls()
         preprocessor.scaler = data['scaler']
-        preprocessor.tfidf_vectorizer = data['tfidf_vectorizer']
+        preprocessor.org_encoder = data['org_encoder']
+        preprocessor.cert_encoder = data['cert_encoder']
+        preprocessor.title_hasher = data['title_hasher']
         preprocessor.feature_names = data['feature_names']
         preprocessor.is_fitted = data['is_fitted']
         
@@ -5,19 +5,26 @@ Implements similarity-based recommendation with clustering and user behavior sim
 
 import pandas as pd
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.cluster import KMeans
-import pickle
+import joblib
 import os
-from preprocessing import CoursePreprocessor
+import hashlib
+from functools import lru_cache
+import ahocorasick
+from preprocessing import COURSE_DTYPES, COURSE_USECOLS
+
+
+# Maximum number of distinct user profiles kept in the per-recommender cache
+PROFILE_CACHE_SIZE = 4096
 
 
 class CourseRecommender:
     """Main recommendation engine"""
     
     def __init__(self, model_path='./kmeans_model.pkl', 
-                 preprocessor_path='./preprocessor.pkl',
-                 data_path='./courses_with_clusters.csv'):
+                 data_path='./courses_with_clusters.csv',
+                 features_path='./course_features.joblib',
+                 normalized_features_path='./course_features_normalized.joblib'):
         """Initialize recommender with trained model"""
         
         import os
@@ -27,26 +34,78 @@ class CourseRecommender:
         
         if not os.path.isabs(model_path):
             model_path = os.path.join(script_dir, model_path)
-        if not os.path.isabs(preprocessor_path):
-            preprocessor_path = os.path.join(script_dir, preprocessor_path)
         if not os.path.isabs(data_path):
             data_path = os.path.join(script_dir, data_path)
+        if not os.path.isabs(features_path):
+            features_path = os.path.join(script_dir, features_path)
+        if not os.path.isabs(normalized_features_path):
+            normalized_features_path = os.path.join(script_dir, normalized_features_path)
         
-        # Load model
-        with open(model_path, 'rb') as f:
-            self.kmeans_model = pickle.load(f)
-        
-        # Load preprocessor
-        self.preprocessor = CoursePreprocessor.load(preprocessor_path)
+        # Load model (arrays are memory-mapped so worker processes share the same pages)
+        self.kmeans_model = joblib.load(model_path, mmap_mode='r')
         
         # Load course data
-        self.courses_df = pd.read_csv(data_path)
+        self.courses_df = pd.read_csv(
+            data_path,
+            dtype={**COURSE_DTYPES, 'enrollment_numeric': 'float64', 'cluster': 'int64'},
+            usecols=COURSE_USECOLS + ['enrollment_numeric', 'cluster']
+        )
         
-        # Precompute feature matrix for all courses
-        self.feature_matrix, _ = self.preprocessor.transform(self.courses_df)
+        # Load the feature matrices precomputed at training time (memory-mapped). The
+        # row-normalized copy turns per-request cosine similarity into a single sparse
+        # matrix product over nnz, and is shared between worker processes
+        self.feature_matrix = joblib.load(features_path, mmap_mode='r')
+        self._feat_norm = joblib.load(normalized_features_path, mmap_mode='r')
+        
+        # Features and course rows are stored separately, so make sure they line up
+        if not (self.feature_matrix.shape[0] == self._feat_norm.shape[0] == len(self.courses_df)):
+            raise ValueError(
+                f"Feature matrices ({self.feature_matrix.shape[0]} and {self._feat_norm.shape[0]} rows) "
+                f"don't match course data ({len(self.courses_df)} rows). Please re-run train.py."
+            )
+        
+        # Cluster assignments were saved alongside the course data at training time
+        self.n_clusters = int(self.kmeans_model.n_clusters)
+        
+        # Cluster summaries only depend on the static course data, so build them once
+        cluster_groups = dict(tuple(self.courses_df.groupby('cluster')))
+        self._cluster_cache = {
+            cluster_id: self._summarize_cluster(
+                cluster_id, cluster_groups.get(cluster_id, self.courses_df.iloc[:0])
+            )
+            for cluster_id in range(self.n_clusters)
+        }
         
-        # Get cluster assignments
-        self.courses_df['cluster'] = self.kmeans_model.predict(self.feature_matrix)
+        # Course listing records and an ETag identifying this version of the course data
+        self.course_records = self.courses_df.to_dict('records')
+        course_hash = pd.util.hash_pandas_object(self.courses_df, index=True).values.tobytes()
+        self.courses_etag = f'"{hashlib.sha1(course_hash).hexdigest()}"'
+        
+        # Cache course columns as NumPy arrays for ranking and output formatting
+        self._title_arr = self.courses_df['course_title'].to_numpy()
+        self._title_lower_arr = self.courses_df['course_title'].fillna('').str.lower().to_numpy()
+        self._org_arr = self.courses_df['course_organization'].to_numpy()
+        self._cert_arr = self.courses_df['course_Certificate_type'].to_numpy()
+        self._diff_arr = self.courses_df['course_difficulty'].to_numpy()
+        self._enrolled_arr = self.courses_df['course_students_enrolled'].to_numpy()
+        self._ratings = self.courses_df['course_rating'].to_numpy()
+        self._enroll_numeric = self.courses_df['enrollment_numeric'].to_numpy()
+        self._clusters = self.courses_df['cluster'].to_numpy()
+        
+        # Static explanation flags
+        self._highly_rated = self._ratings >= 4.5
+        self._popular = self._enroll_numeric >= 1_000_000
+        
+        # Secondary boosts for higher ratings and enrollments are static, so normalize them once
+        # (smaller weights to maintain similarity as primary signal)
+        ratings = self._ratings.astype(np.float32)
+        enrollments = self._enroll_numeric.astype(np.float32)
+        self._rating_boost = 0.05 * (ratings - ratings.min()) / (ratings.max() - ratings.min() + 1e-6)
+        self._enrollment_boost = 0.03 * (enrollments - enrollments.min()) / \
+                                 (enrollments.max() - enrollments.min() + 1e-6)
+        
+        # Cache user profiles keyed on normalized (hashable) preferences
+        self._cached_user_profile = lru_cache(maxsize=PROFILE_CACHE_SIZE)(self._build_user_profile)
     
     def _create_user_profile(self, preferred_difficulty=None, liked_courses=None, 
                             preferred_organizations=None, rating_bias=0.1):
@@ -60,48 +119,85 @@ class CourseRecommender:
             rating_bias: Weight for rating preference (0-1)
         
         Returns:
-            user_profile: Feature vector representing user preferences
+            user_profile: Read-only feature vector representing user preferences
+                (shared with the profile cache, do not mutate)
+        """
+        # Order and duplicates don't affect the profile, so normalize them away for the cache key
+        return self._cached_user_profile(
+            preferred_difficulty,
+            tuple(sorted(set(liked_courses or ()))),
+            tuple(sorted(set(preferred_organizations or ()))),
+            float(rating_bias)
+        )
+    
+    def _partial_title_matches(self, liked_courses, candidates):
         """
+        Case-insensitive substring match of liked courses against candidate titles
+        
+        Builds a single Aho-Corasick automaton so each title is scanned once
+        regardless of how many liked courses there are.
+        """
+        words = {course.lower() for course in liked_courses}
+        if '' in words:
+            # An empty pattern matches every title
+            return np.ones(candidates.size, dtype=bool)
+        
+        automaton = ahocorasick.Automaton()
+        for i, word in enumerate(words):
+            automaton.add_word(word, i)
+        automaton.make_automaton()
+        
+        return np.fromiter(
+            (next(automaton.iter(title), None) is not None
+             for title in self._title_lower_arr[candidates]),
+            dtype=bool, count=candidates.size
+        )
+    
+    def profile_cache_info(self):
+        """Get hit/miss statistics of the user profile cache"""
+        return self._cached_user_profile.cache_info()._asdict()
+    
+    def _build_user_profile(self, preferred_difficulty, liked_courses,
+                            preferred_organizations, rating_bias):
+        """Build a user profile vector from normalized preferences (see _create_user_profile)"""
         # Start with zero vector matching feature dimensions
-        user_profile = np.zeros(self.feature_matrix.shape[1])
+        user_profile = np.zeros(self.feature_matrix.shape[1], dtype=np.float32)
         
-        # Find courses matching user preferences
-        matching_courses = self.courses_df.copy()
+        # Find courses matching user preferences (boolean mask over course rows)
+        keep = np.ones(len(self._title_arr), dtype=bool)
         
         # Filter by difficulty if specified
         if preferred_difficulty:
-            matching_courses = matching_courses[
-                matching_courses['course_difficulty'] == preferred_difficulty
-            ]
+            keep &= self._diff_arr == preferred_difficulty
         
         # Filter by liked courses if specified
         if liked_courses:
-            liked_mask = matching_courses['course_title'].isin(liked_courses)
+            liked_mask = keep & np.isin(self._title_arr, liked_courses)
             if liked_mask.any():
-                matching_courses = matching_courses[liked_mask]
+                keep = liked_mask
             else:
                 # If exact matches not found, use partial matching
-                liked_mask = matching_courses['course_title'].str.contains(
-                    '|'.join(liked_courses), case=False, na=False
-                )
+                candidates = np.flatnonzero(keep)
+                liked_mask = np.zeros_like(keep)
+                liked_mask[candidates] = self._partial_title_matches(liked_courses, candidates)
                 if liked_mask.any():
-                    matching_courses = matching_courses[liked_mask]
+                    keep = liked_mask
         
         # Filter by organizations if specified
         if preferred_organizations:
-            org_mask = matching_courses['course_organization'].isin(preferred_organizations)
+            org_mask = keep & np.isin(self._org_arr, preferred_organizations)
             if org_mask.any():
-                matching_courses = matching_courses[org_mask]
+                keep = org_mask
         
         # If no matching courses, use all courses with preference weighting
-        if len(matching_courses) == 0:
-            matching_courses = self.courses_df.copy()
+        if not keep.any():
+            keep = np.ones_like(keep)
             weight = 0.5  # Lower weight if no exact matches
         else:
             weight = 1.0
         
         # Get indices of matching courses
-        matching_indices = matching_courses.index.tolist()
+        matching_indices = np.flatnonzero(keep)
         
         # Create user profile as weighted average of matching courses
         if len(matching_indices) > 0:
@@ -109,21 +205,24 @@ class CourseRecommender:
             
             # Apply rating-based weighting if rating_bias > 0
             if rating_bias > 0:
-                ratings = matching_courses['course_rating'].values
+                ratings = self._ratings[matching_indices]
                 # Normalize ratings to 0-1 range for weighting
                 rating_weights = (ratings - ratings.min()) / (ratings.max() - ratings.min() + 1e-6)
-                rating_weights = 1 + rating_bias * rating_weights
+                rating_weights = (1 + rating_bias * rating_weights).astype(np.float32)
                 # Apply weights
-                matching_features = matching_features * rating_weights.reshape(-1, 1)
+                matching_features = matching_features.multiply(rating_weights.reshape(-1, 1))
             
             # Average the features
-            user_profile = matching_features.mean(axis=0) * weight
+            user_profile = np.asarray(matching_features.mean(axis=0), dtype=np.float32).ravel() * weight
         
         # Normalize user profile
         profile_norm = np.linalg.norm(user_profile)
         if profile_norm > 0:
             user_profile = user_profile / profile_norm
         
+        # Cached profiles are shared between requests
+        user_profile.setflags(write=False)
+        
         return user_profile
     
     def recommend(self, preferred_difficulty=None, liked_courses=None,
@@ -143,89 +242,129 @@ class CourseRecommender:
         Returns:
             List of recommended courses with similarity scores and explanations
         """
-        # Create user profile
-        user_profile = self._create_user_profile(
-            preferred_difficulty=preferred_difficulty,
-            liked_courses=liked_courses,
-            preferred_organizations=preferred_organizations,
-            rating_bias=rating_bias
-        )
-        
-        # Reshape for cosine similarity
-        user_profile = user_profile.reshape(1, -1)
-        
-        # Calculate cosine similarity with all courses
-        similarities = cosine_similarity(user_profile, self.feature_matrix)[0]
+        return self.recommend_batch([{
+            'preferred_difficulty': preferred_difficulty,
+            'liked_courses': liked_courses,
+            'preferred_organizations': preferred_organizations,
+            'limit': limit,
+            'rating_bias': rating_bias,
+            'exclude_courses': exclude_courses
+        }])[0]
+    
+    def recommend_batch(self, requests):
+        """
+        Generate course recommendations for several users at once
         
-        # Get user's cluster (predict cluster for user profile)
-        user_cluster = self.kmeans_model.predict(user_profile)[0]
+        Stacks all user profiles into one matrix so similarities for the whole
+        batch are computed with a single matrix product.
         
-        # Create results dataframe
-        results = self.courses_df.copy()
-        results['similarity_score'] = similarities
+        Args:
+            requests: List of dicts holding the keyword arguments of recommend()
         
+        Returns:
+            List of recommendation lists, one per request
+        """
+        # Create user profiles
+        user_profiles = np.vstack([
+            self._create_user_profile(
+                preferred_difficulty=req.get('preferred_difficulty'),
+                liked_courses=req.get('liked_courses'),
+                preferred_organizations=req.get('preferred_organizations'),
+                rating_bias=req.get('rating_bias', 0.1)
+            )
+            for req in requests
+        ])
+        
+        # Calculate cosine similarity with all courses (user profiles are already L2-normalized)
+        similarities = (self._feat_norm @ user_profiles.T).T
+        
+        # Get users' clusters (predict cluster for each user profile)
+        user_clusters = self.kmeans_model.predict(user_profiles)
+        
+        return [
+            self._rank_courses(
+                similarities[i],
+                user_clusters[i],
+                preferred_difficulty=req.get('preferred_difficulty'),
+                liked_courses=req.get('liked_courses'),
+                preferred_organizations=req.get('preferred_organizations'),
+                limit=req.get('limit', 10),
+                exclude_courses=req.get('exclude_courses')
+            )
+            for i, req in enumerate(requests)
+        ]
+    
+    def _rank_courses(self, similarities, user_cluster, preferred_difficulty=None,
+                      liked_courses=None, preferred_organizations=None, limit=10,
+                      exclude_courses=None):
+        """Boost, filter and format the top courses for one user's similarity scores"""
         # Boost scores for courses in same cluster
-        same_cluster_mask = results['cluster'] == user_cluster
-        results.loc[same_cluster_mask, 'similarity_score'] *= 1.2
-        
-        # Secondary boost for higher ratings and enrollments
-        rating_normalized = (results['course_rating'] - results['course_rating'].min()) / \
-                           (results['course_rating'].max() - results['course_rating'].min() + 1e-6)
-        enrollment_normalized = (results['enrollment_numeric'] - results['enrollment_numeric'].min()) / \
-                               (results['enrollment_numeric'].max() - results['enrollment_numeric'].min() + 1e-6)
+        scores = similarities.copy()
+        scores[self._clusters == user_cluster] *= 1.2
         
-        # Apply boosts (smaller weights to maintain similarity as primary signal)
-        results['similarity_score'] += 0.05 * rating_normalized
-        results['similarity_score'] += 0.03 * enrollment_normalized
+        # Apply precomputed rating and enrollment boosts
+        scores += self._rating_boost
+        scores += self._enrollment_boost
         
-        # Exclude specified courses
+        # Exclude specified and already liked courses
+        keep = np.ones(len(scores), dtype=bool)
         if exclude_courses:
-            exclude_mask = results['course_title'].isin(exclude_courses)
-            results = results[~exclude_mask]
-        
-        # Exclude already liked courses
+            keep &= ~np.isin(self._title_arr, exclude_courses)
         if liked_courses:
-            liked_mask = results['course_title'].isin(liked_courses)
-            results = results[~liked_mask]
-        
-        # Sort by similarity score
-        results = results.sort_values('similarity_score', ascending=False)
-        
-        # Get top recommendations
-        top_recommendations = results.head(limit)
-        
-        # Format output
+            keep &= ~np.isin(self._title_arr, liked_courses)
+        candidates = np.flatnonzero(keep)
+        
+        # Select the top recommendations without sorting every course
+        k = min(limit, candidates.size)
+        if k == 0:
+            return []
+        candidate_scores = scores[candidates]
+        top = np.argpartition(-candidate_scores, k - 1)[:k]
+        top_idx = candidates[top[np.argsort(-candidate_scores[top], kind='stable')]]
+        
+        # Format output from the top rows of each column (converted to Python scalars)
         recommendations = []
-        for idx, row in top_recommendations.iterrows():
+        for (title, org, cert, rating, difficulty, enrolled, score, cluster,
+             highly_rated, popular) in zip(
+                self._title_arr[top_idx].tolist(),
+                self._org_arr[top_idx].tolist(),
+                self._cert_arr[top_idx].tolist(),
+                self._ratings[top_idx].tolist(),
+                self._diff_arr[top_idx].tolist(),
+                self._enrolled_arr[top_idx].tolist(),
+                scores[top_idx].tolist(),
+                self._clusters[top_idx].tolist(),
+                self._highly_rated[top_idx].tolist(),
+                self._popular[top_idx].tolist()):
             # Generate explanation
             explanation_parts = []
             
-            if row['cluster'] == user_cluster:
+            if cluster == user_cluster:
                 explanation_parts.append("Same cluster as your preferences")
             
-            if preferred_difficulty and row['course_difficulty'] == preferred_difficulty:
+            if preferred_difficulty and difficulty == preferred_difficulty:
                 explanation_parts.append(f"Matches your {preferred_difficulty} difficulty preference")
             
-            if preferred_organizations and row['course_organization'] in preferred_organizations:
-                explanation_parts.append(f"From preferred organization: {row['course_organization']}")
+            if preferred_organizations and org in preferred_organizations:
+                explanation_parts.append(f"From preferred organization: {org}")
             
-            if row['course_rating'] >= 4.5:
+            if highly_rated:
                 explanation_parts.append("Highly rated course")
             
-            if row['enrollment_numeric'] >= 1_000_000:
+            if popular:
                 explanation_parts.append("Popular course (1M+ enrollments)")
             
             explanation = "; ".join(explanation_parts) if explanation_parts else "Similar content and features"
             
             recommendations.append({
-                'course_title': row['course_title'],
-                'organization': row['course_organization'],
-                'certificate_type': row['course_Certificate_type'],
-                'rating': float(row['course_rating']),
-                'difficulty': row['course_difficulty'],
-                'students_enrolled': str(row['course_students_enrolled']),
-                'similarity_score': float(row['similarity_score']),
-                'cluster': int(row['cluster']),
+                'course_title': title,
+                'organization': org,
+                'certificate_type': cert,
+                'rating': rating,
+                'difficulty': difficulty,
+                'students_enrolled': str(enrolled),
+                'similarity_score': score,
+                'cluster': cluster,
                 'explanation': explanation
             })
         
@@ -233,13 +372,20 @@ class CourseRecommender:
     
     def get_cluster_info(self, cluster_id):
         """Get information about a specific cluster"""
-        cluster_courses = self.courses_df[self.courses_df['cluster'] == cluster_id]
+        return self._cluster_cache[cluster_id]
+    
+    @staticmethod
+    def _summarize_cluster(cluster_id, cluster_courses):
+        """Summarize the courses assigned to one cluster"""
+        # Count plain values: categorical counts would list every category, including zeros
+        difficulties = cluster_courses['course_difficulty'].astype(object)
+        organizations = cluster_courses['course_organization'].astype(object)
         
         return {
             'cluster_id': cluster_id,
             'n_courses': len(cluster_courses),
             'avg_rating': float(cluster_courses['course_rating'].mean()),
-            'difficulty_distribution': cluster_courses['course_difficulty'].value_counts().to_dict(),
-            'top_organizations': cluster_courses['course_organization'].value_counts().head(5).to_dict(),
+            'difficulty_distribution': difficulties.value_counts().to_dict(),
+            'top_organizations': organizations.value_counts().head(5).to_dict(),
             'sample_courses': cluster_courses['course_title'].head(10).tolist()
         }
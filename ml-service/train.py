@@ -5,14 +5,23 @@ Trains KMeans clustering model with optimal k selection via Elbow Method
 
 import pandas as pd
 import numpy as np
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.metrics import silhouette_score
 import matplotlib
 matplotlib.use('Agg')  # Non-interactive backend
 import matplotlib.pyplot as plt
-import pickle
+import joblib
+from joblib import Parallel, delayed
 import os
-from preprocessing import CoursePreprocessor
+from preprocessing import CoursePreprocessor, COURSE_DTYPES, COURSE_USECOLS
+
+
+def _fit_inertia(X, k):
+    """Fit a MiniBatchKMeans with k clusters and return its inertia"""
+    kmeans = MiniBatchKMeans(n_clusters=k, random_state=42, n_init=3,
+                             batch_size=4096, max_iter=100)
+    kmeans.fit(X)
+    return kmeans.inertia_
 
 
 def calculate_elbow_k(X, max_k=15, min_k=2):
@@ -20,13 +29,12 @@ def calculate_elbow_k(X, max_k=15, min_k=2):
     Find optimal k using Elbow Method
     Returns optimal k and inertia values
     """
-    inertias = []
     k_range = range(min_k, max_k + 1)
     
-    for k in k_range:
-        kmeans = KMeans(n_clusters=k, random_state=42, n_init=10, max_iter=300)
-        kmeans.fit(X)
-        inertias.append(kmeans.inertia_)
+    # Each k is independent, so sweep them in parallel
+    inertias = Parallel(n_jobs=-1, backend='loky')(
+        delayed(_fit_inertia)(X, k) for k in k_range
+    )
     
     # Calculate rate of change (second derivative approximation)
     # Elbow is where the rate of decrease slows significantly
@@ -62,7 +70,7 @@ def train_model(data_path=None, output_dir='./'):
     
     # Load data
     print("Loading course data...")
-    df = pd.read_csv(data_path)
+    df = pd.read_csv(data_path, dtype=COURSE_DTYPES, usecols=COURSE_USECOLS)
     print(f"Loaded {len(df)} courses")
     
     # Preprocess
@@ -89,16 +97,22 @@ def train_model(data_path=None, output_dir='./'):
     df_processed['cluster'] = cluster_labels
     
     # Calculate intra-cluster similarity (average cosine similarity within clusters)
-    from sklearn.metrics.pairwise import cosine_similarity
+    # Uses sum_ij(x_i . x_j) = (sum_i x_i) . (sum_i x_i) on L2-normalized rows,
+    # so no pairwise similarity matrix is materialized
+    from sklearn.preprocessing import normalize
+    X_normalized = normalize(X, norm='l2')
     intra_cluster_similarities = []
     for cluster_id in range(optimal_k):
         cluster_mask = cluster_labels == cluster_id
-        cluster_data = X[cluster_mask]
-        if len(cluster_data) > 1:
-            similarities = cosine_similarity(cluster_data)
-            # Get upper triangle (excluding diagonal)
-            triu_indices = np.triu_indices(len(similarities), k=1)
-            intra_cluster_similarities.append(similarities[triu_indices].mean())
+        cluster_data = X_normalized[cluster_mask]
+        n = cluster_data.shape[0]
+        if n > 1:
+            summed = np.asarray(cluster_data.sum(axis=0), dtype=np.float64).ravel()
+            # Exclude self-similarities (diagonal)
+            self_similarities = cluster_data.multiply(cluster_data).sum()
+            intra_cluster_similarities.append(
+                (summed @ summed - self_similarities) / (n * (n - 1))
+            )
     
     avg_intra_cluster_sim = np.mean(intra_cluster_similarities) if intra_cluster_similarities else 0
     print(f"Average Intra-Cluster Similarity: {avg_intra_cluster_sim:.4f}")
@@ -107,11 +121,16 @@ def train_model(data_path=None, output_dir='./'):
     print("Saving model artifacts...")
     os.makedirs(output_dir, exist_ok=True)
     
-    with open(os.path.join(output_dir, 'kmeans_model.pkl'), 'wb') as f:
-        pickle.dump(kmeans, f)
+    # Uncompressed joblib files let the service memory-map the arrays
+    joblib.dump(kmeans, os.path.join(output_dir, 'kmeans_model.pkl'), compress=0)
     
     preprocessor.save(os.path.join(output_dir, 'preprocessor.pkl'))
     
+    # Save the course feature matrix (and its row-normalized copy used for similarity
+    # scoring) so the service doesn't recompute them
+    joblib.dump(X, os.path.join(output_dir, 'course_features.joblib'), compress=0)
+    joblib.dump(X_normalized, os.path.join(output_dir, 'course_features_normalized.joblib'), compress=0)
+    
     # Save processed data with clusters
     df_processed.to_csv(os.path.join(output_dir, 'courses_with_clusters.csv'), index=False)
     